@@ -1,22 +1,27 @@
 # app_fixed_report_details.py
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
 from pathlib import Path
 import hashlib
+import hmac
+import io
 import os
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import base64
 import shutil
-import glob
+import zipfile
+import warnings
+import atexit
 import requests  # optional: only used if Graph upload is enabled and Dropbox
 import json
-from PIL import Image
 import time
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # ====================================================
 # === THEME & BRAND COLOURS ===
@@ -27,13 +32,107 @@ LIGHT_BLUE = "#E6F2FA"
 WHITE = "#FFFFFF"
 GREY = "#F5F7FA"
 
+# Streamlit re-executes this script on every rerun, so the markup is built in
+# cache_resource functions to format it once per process (per year for the footer).
+@st.cache_resource(show_spinner=False)
+def _theme_css():
+    return f"""
+        <style>
+            .stApp {{
+                background-color: {WHITE};
+                color: {PRIMARY_BLUE};
+                font-family: 'Helvetica Neue', sans-serif;
+            }}
+            h1, h2, h3, h4 {{
+                color: {PRIMARY_BLUE};
+            }}
+            .stButton>button {{
+                background-color: {SECONDARY_BLUE};
+                color: {WHITE};
+                border: none;
+                border-radius: 8px;
+                padding: 0.6rem 1rem;
+                font-size: 1rem;
+                transition: 0.3s;
+            }}
+            .stButton>button:hover {{
+                background-color: {PRIMARY_BLUE};
+                color: {WHITE};
+            }}
+            [data-testid="stSidebar"] {{
+                background: linear-gradient(180deg, {PRIMARY_BLUE}, {SECONDARY_BLUE});
+                color: {WHITE};
+            }}
+            [data-testid="stSidebar"] h2, [data-testid="stSidebar"] h3, [data-testid="stSidebar"] h4, [data-testid="stSidebar"] p, [data-testid="stSidebar"] span {{
+                color: {WHITE};
+            }}
+            [data-testid="stSidebar"] a {{
+                color: {WHITE} !important;
+            }}
+            .stDataFrame tbody td {{
+                color: {PRIMARY_BLUE};
+            }}
+            .stDataFrame thead th {{
+                background-color: {SECONDARY_BLUE};
+                color: {WHITE};
+            }}
+            .footer {{
+                position: fixed;
+                bottom: 0;
+                width: 100%;
+                background-color: {PRIMARY_BLUE};
+                color: {WHITE};
+                text-align: center;
+                padding: 10px;
+                font-size: 0.9rem;
+            }}
+        </style>
+    """
+
+THEME_CSS = _theme_css()
+
+@st.cache_resource(show_spinner=False)
+def _footer_html(year):
+    return f"""
+        <style>
+            .footer {{
+                position: fixed;
+                left: 0;
+                bottom: 0;
+                width: 100%;
+                background-color: #003366;
+                color: white;
+                text-align: center;
+                padding: 10px 0;
+                font-size: 14px;
+                border-top: 1px solid #ddd;
+                z-index: 100;
+            }}
+        </style>
+        <div class="footer">
+            © {year} eThekwini Municipality-WS7761 | Smart Meter Stock Management System
+        </div>
+    """
+
+FOOTER_HTML = _footer_html(datetime.now().year)
+
 # ====================================================
 # === PAGE CONFIG ===
 # ====================================================
 ROOT = Path(__file__).parent
 favicon_path = ROOT / "favicon.jpg"
+
+# show_spinner=False: nothing may render before set_page_config.
+@st.cache_resource(show_spinner=False)
+def _load_favicon(path_str, mtime):
+    # PIL is only needed for the favicon, so import it on first use
+    from PIL import Image
+    img = Image.open(path_str)
+    img.load()
+    return img
+
 if favicon_path.exists():
-    favicon_image = Image.open(favicon_path)
+    favicon_image = _load_favicon(str(favicon_path), favicon_path.stat().st_mtime)
 else:
     favicon_image = None
 
@@ -46,58 +145,14 @@ st.set_page_config(
 # ====================================================
 # === CUSTOM CSS FOR THEME ===
 # ====================================================
-st.markdown(f"""
-    <style>
-        .stApp {{
-            background-color: {WHITE};
-            color: {PRIMARY_BLUE};
-            font-family: 'Helvetica Neue', sans-serif;
-        }}
-        h1, h2, h3, h4 {{
-            color: {PRIMARY_BLUE};
-        }}
-        .stButton>button {{
-            background-color: {SECONDARY_BLUE};
-            color: {WHITE};
-            border: none;
-            border-radius: 8px;
-            padding: 0.6rem 1rem;
-            font-size: 1rem;
-            transition: 0.3s;
-        }}
-        .stButton>button:hover {{
-            background-color: {PRIMARY_BLUE};
-            color: {WHITE};
-        }}
-        [data-testid="stSidebar"] {{
-            background: linear-gradient(180deg, {PRIMARY_BLUE}, {SECONDARY_BLUE});
-            color: {WHITE};
-        }}
-        [data-testid="stSidebar"] h2, [data-testid="stSidebar"] h3, [data-testid="stSidebar"] h4, [data-testid="stSidebar"] p, [data-testid="stSidebar"] span {{
-            color: {WHITE};
-        }}
-        [data-testid="stSidebar"] a {{
-            color: {WHITE} !important;
-        }}
-        .stDataFrame tbody td {{
-            color: {PRIMARY_BLUE};
-        }}
-        .stDataFrame thead th {{
-            background-color: {SECONDARY_BLUE};
-            color: {WHITE};
-        }}
-        .footer {{
-            position: fixed;
-            bottom: 0;
-            width: 100%;
-            background-color: {PRIMARY_BLUE};
-            color: {WHITE};
-            text-align: center;
-            padding: 10px;
-            font-size: 0.9rem;
-        }}
-    </style>
-""", unsafe_allow_html=True)
+def emit_html(markup):
+    """Raw HTML/CSS via st.html (Streamlit 1.33+), which skips the markdown parser; st.markdown on older versions."""
+    if hasattr(st, "html"):
+        st.html(markup)
+    else:
+        st.markdown(markup, unsafe_allow_html=True)
+
+emit_html(THEME_CSS)
 
 # ====================================================
 # === DIRECTORY SETUP (PERSISTENT STORAGE) ===
@@ -109,21 +164,85 @@ REPORT_DIR = ROOT / "reports"
 DUMP_DIR = DATA_DIR / "dumps"
 BACKUP_ZIP_PREFIX = ROOT / "data_backup"  # will create data_backup.zip
 BACKUP_FILE = Path(str(BACKUP_ZIP_PREFIX) + ".zip")
+# CSVs are small and the zip mostly lands in a local sync folder, so favour
+# speed over ratio: level 1 deflate is several times cheaper than the default 6.
+BACKUP_COMPRESSLEVEL = 1
+# Already-compressed formats gain nothing from deflate; store them as-is.
+STORED_SUFFIXES = {".jpg", ".jpeg", ".png", ".pdf", ".parquet", ".zip"}
 
 for d in [DATA_DIR, PHOTO_DIR, ISSUED_PHOTOS_DIR, REPORT_DIR, DUMP_DIR]:
     d.mkdir(parents=True, exist_ok=True)
 
-DATA_FILE = DATA_DIR / "stock_requests.csv"
+# Primary store is Parquet: typed, columnar and much cheaper to read back on
+# every rerun than re-tokenising CSV text. The old CSV is migrated on load.
+DATA_FILE = DATA_DIR / "stock_requests.parquet"
+DATA_COMPRESSION = "zstd"
+LEGACY_CSV_FILE = DATA_DIR / "stock_requests.csv"
+# After migration the CSV is kept under this name (not deleted: it may be
+# tracked in the deployment checkout) and left out of backups.
+MIGRATED_CSV_FILE = LEGACY_CSV_FILE.with_name(LEGACY_CSV_FILE.name + ".migrated")
+# DATA_DIR files that are never archived; *.tmp are write_parquet_atomic's
+# in-flight files, which vanish (or are half-written) while the backup walks
+BACKUP_SKIP_SUFFIXES = (".migrated", ".tmp")
+
+def write_parquet_atomic(df, path: Path):
+    """
+    Write df to a per-thread temp file next to path and swap it in with
+    os.replace, so a crash mid-write or a concurrent reader never sees a
+    truncated file. The temp file is removed if the write fails.
+    """
+    tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    try:
+        df.to_parquet(tmp, index=False, compression=DATA_COMPRESSION)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def _arrow_string_dtype():
+    """
+    Arrow-backed string dtype that still uses NaN for missing values, so the
+    existing pd.isna / truthiness checks behave as with object columns.
+    This is pandas 3's default `str`; pandas 2.1+ spells it "pyarrow_numpy".
+    """
+    for args, kwargs in ((("pyarrow",), {"na_value": np.nan}), (("pyarrow_numpy",), {})):
+        try:
+            return pd.StringDtype(*args, **kwargs)
+        except (TypeError, ValueError, ImportError):
+            continue
+    return object
+
+STRING_DTYPE = _arrow_string_dtype()
+
+def read_csv_fast(path, **kwargs):
+    """
+    Read a CSV as all-string columns using the multithreaded pyarrow parser,
+    straight into Arrow-backed strings.
+    Falls back to the default C engine if pyarrow is not installed.
+    """
+    try:
+        return pd.read_csv(path, dtype=STRING_DTYPE, engine="pyarrow", **kwargs)
+    except ImportError:
+        return pd.read_csv(path, dtype=str, **kwargs)
 
 # ====================================================
 # === ONE DRIVE CONFIG (LOCAL SYNC FOLDER) ===
 # ====================================================
 ONE_DRIVE_SYNC_ROOT = Path(r"C:\Users\ADMIN\OneDrive")
 ONE_DRIVE_BACKUP_DIR = ONE_DRIVE_SYNC_ROOT / "SmartMeter_Backups"
-try:
-    ONE_DRIVE_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
-except Exception:
-    pass
+
+@st.cache_resource(show_spinner=False)
+def _onedrive_ready():
+    """
+    Create and probe the sync folder once per process instead of on every
+    rerun and save; on Windows each stat may go through the OneDrive
+    placeholder provider.
+    """
+    try:
+        ONE_DRIVE_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+        return ONE_DRIVE_BACKUP_DIR.exists() and os.access(ONE_DRIVE_BACKUP_DIR, os.W_OK)
+    except Exception:
+        return False
 
 def get_secret(key):
     try:
@@ -154,10 +273,18 @@ def get_dropbox_credentials():
     app_secret = get_secret("DROPBOX_app_secret")
     return refresh, app_key, app_secret
 
+@st.cache_resource(show_spinner=False)
+def _dropbox_client():
+    """
+    Process-wide Dropbox state: one pooled HTTP session plus the current
+    access token, shared by every user session and the backup worker.
+    """
+    return {"session": requests.Session(), "token": None, "expires_at": 0, "lock": threading.Lock()}
+
 def get_dropbox_access_token(force_refresh=False):
     """
     Obtain an access token from Dropbox using the refresh token flow.
-    Caches token + expiry in st.session_state to avoid unnecessary calls.
+    Caches token + expiry in _dropbox_client() so all sessions share it.
     Returns access_token string or None on failure.
     """
     refresh, app_key, app_secret = get_dropbox_credentials()
@@ -165,18 +292,20 @@ def get_dropbox_access_token(force_refresh=False):
         # secrets not provided
         return None
 
-    # session cache
+    client = _dropbox_client()
+    with client["lock"]:
+        return _refresh_dropbox_token(client, refresh, app_key, app_secret, force_refresh)
+
+def _refresh_dropbox_token(client, refresh, app_key, app_secret, force_refresh):
+    """Return the shared token, fetching a new one when it is missing or about to expire."""
     now = time.time()
-    token_info = st.session_state.get("dropbox_token_info", None)
-    if token_info and not force_refresh:
-        expires_at = token_info.get("expires_at", 0)
-        # if token still valid (give 30s leeway)
-        if expires_at and (expires_at - 30) > now:
-            return token_info.get("access_token")
+    # if token still valid (give 30s leeway)
+    if client["token"] and not force_refresh and (client["expires_at"] - 30) > now:
+        return client["token"]
 
     # Make request to Dropbox OAuth2 token endpoint
     try:
-        resp = requests.post(
+        resp = client["session"].post(
             "https://api.dropbox.com/oauth2/token",
             data={
                 "grant_type": "refresh_token",
@@ -191,10 +320,8 @@ def get_dropbox_access_token(force_refresh=False):
             access = j.get("access_token")
             expires_in = j.get("expires_in", 4 * 60 * 60)  # default 4 hours if not provided
             if access:
-                st.session_state["dropbox_token_info"] = {
-                    "access_token": access,
-                    "expires_at": now + int(expires_in)
-                }
+                client["token"] = access
+                client["expires_at"] = now + int(expires_in)
                 return access
         else:
             # Try to capture error in session for debugging
@@ -210,21 +337,74 @@ def get_dropbox_access_token(force_refresh=False):
 # ====================================================
 # === BACKUP & RESTORE HELPERS ===
 # ====================================================
+def _zip_data_file(zf, path: Path, arcname: str):
+    if path.suffix.lower() in STORED_SUFFIXES:
+        zf.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+    else:
+        zf.write(path, arcname, compress_type=zipfile.ZIP_DEFLATED, compresslevel=BACKUP_COMPRESSLEVEL)
+
+def _update_backup_zip():
+    """
+    Bring BACKUP_FILE up to date with DATA_DIR.
+    Only files added or modified since the previous run are appended, so a
+    save costs O(changed files) instead of re-compressing the whole folder.
+    The zip comment records when that previous run started. Appending a name
+    that is already archived leaves the old copy behind (extraction keeps the
+    last one), so the archive is rebuilt from scratch when it is missing, when
+    a file was deleted, or when superseded copies outweigh the live ones.
+    """
+    started = time.time()
+    files = {}
+    for dirpath, _dirnames, filenames in os.walk(DATA_DIR):
+        for name in filenames:
+            if name.endswith(BACKUP_SKIP_SUFFIXES):
+                continue
+            path = Path(dirpath) / name
+            files[path.relative_to(DATA_DIR).as_posix()] = path
+    mode, to_write = "w", list(files)
+    if BACKUP_FILE.exists():
+        try:
+            with zipfile.ZipFile(BACKUP_FILE) as zf:
+                since = float(zf.comment.decode() or 0)
+                latest, stale_bytes = {}, 0
+                for info in zf.infolist():
+                    if info.filename in latest:
+                        stale_bytes += latest[info.filename].compress_size
+                    latest[info.filename] = info
+            live_bytes = sum(i.compress_size for i in latest.values())
+            changed = [n for n, p in files.items() if n not in latest or p.stat().st_mtime >= since]
+            superseded = sum(latest[n].compress_size for n in changed if n in latest)
+            if since and not set(latest) - set(files) and stale_bytes + superseded <= live_bytes:
+                mode, to_write = "a", changed
+        except (zipfile.BadZipFile, ValueError):
+            pass
+    if mode == "a" and not to_write:
+        return
+    with warnings.catch_warnings():
+        # Re-adding an existing name is the point of append mode.
+        warnings.filterwarnings("ignore", message="Duplicate name")
+        with zipfile.ZipFile(BACKUP_FILE, mode) as zf:
+            for name in to_write:
+                _zip_data_file(zf, files[name], name)
+            zf.comment = str(started).encode()
+
 def create_local_zip():
+    """
+    Bring the zip up to date and return its path. Callers that go on to upload
+    it must hold zip_lock across both steps (see backup_data), or another run
+    could append to or rebuild the file while it is being sent.
+    """
     try:
-        if BACKUP_FILE.exists():
-            try:
-                BACKUP_FILE.unlink()
-            except Exception:
-                pass
-        archive_path = shutil.make_archive(str(BACKUP_ZIP_PREFIX), 'zip', root_dir=str(DATA_DIR))
-        return Path(archive_path)
+        # The background backup and the manual button may both get here.
+        with _backup_worker()["zip_lock"]:
+            _update_backup_zip()
+        return BACKUP_FILE
     except Exception as e:
         st.warning(f"Could not create archive: {e}")
         return None
 
 def copy_zip_to_onedrive(zip_path: Path):
-    if not ONE_DRIVE_BACKUP_DIR or not Path(ONE_DRIVE_BACKUP_DIR).exists():
+    if not _onedrive_ready():
         return False
     try:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -236,6 +416,66 @@ def copy_zip_to_onedrive(zip_path: Path):
         st.warning(f"Failed to copy backup to OneDrive folder: {e}")
         return False
 
+GRAPH_SIMPLE_UPLOAD_LIMIT = 4 * 1024 * 1024
+GRAPH_CHUNK_SIZE = 5 * 1024 * 1024  # Graph wants multiples of 320 KiB
+GRAPH_CHUNK_RETRIES = 3
+
+@st.cache_resource(show_spinner=False)
+def _graph_session():
+    """Keep-alive HTTP session so backups reuse the Graph TLS connection."""
+    return requests.Session()
+
+def _graph_upload_large(session, remote_path, zip_path: Path, token):
+    """
+    Resumable upload for zips over the simple-PUT limit: open an upload
+    session and PUT fixed-size chunks with Content-Range. A failed chunk asks
+    the session where to resume instead of starting again from zero.
+    """
+    create_url = f"https://graph.microsoft.com/v1.0/me/drive/root:{remote_path}:/createUploadSession"
+    resp = session.post(
+        create_url,
+        headers={"Authorization": f"Bearer {token}"},
+        json={"item": {"@microsoft.graph.conflictBehavior": "replace"}},
+        timeout=30,
+    )
+    if resp.status_code not in (200, 201):
+        return resp
+    upload_url = resp.json()["uploadUrl"]
+    total = zip_path.stat().st_size
+    offset = 0
+    failures = 0
+    with open(zip_path, "rb") as f:
+        while offset < total:
+            f.seek(offset)
+            chunk = f.read(GRAPH_CHUNK_SIZE)
+            end = offset + len(chunk) - 1
+            try:
+                # The pre-authenticated upload URL must not get the Authorization header
+                resp = session.put(
+                    upload_url,
+                    headers={"Content-Length": str(len(chunk)), "Content-Range": f"bytes {offset}-{end}/{total}"},
+                    data=chunk,
+                    timeout=120,
+                )
+            except requests.RequestException:
+                resp = None
+            if resp is not None and resp.status_code in (200, 201):
+                return resp
+            if resp is not None and resp.status_code == 202:
+                offset = end + 1
+                failures = 0
+                continue
+            failures += 1
+            if failures > GRAPH_CHUNK_RETRIES:
+                if resp is None:
+                    raise RuntimeError("Graph upload session lost its connection")
+                return resp
+            status = session.get(upload_url, timeout=30)
+            ranges = status.json().get("nextExpectedRanges") if status.ok else None
+            if ranges:
+                offset = int(ranges[0].split("-")[0])
+    return resp
+
 def upload_zip_to_onedrive_graph(zip_path: Path):
     token = ONEDRIVE_ACCESS_TOKEN
     if not token:
@@ -243,13 +483,17 @@ def upload_zip_to_onedrive_graph(zip_path: Path):
     try:
         filename = zip_path.name
         remote_path = f"/Apps/AcucommBackups/{filename}"
-        upload_url = f"https://graph.microsoft.com/v1.0/me/drive/root:{remote_path}:/content"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/zip"
-        }
-        with open(zip_path, "rb") as f:
-            resp = requests.put(upload_url, headers=headers, data=f)
+        session = _graph_session()
+        if zip_path.stat().st_size > GRAPH_SIMPLE_UPLOAD_LIMIT:
+            resp = _graph_upload_large(session, remote_path, zip_path, token)
+        else:
+            upload_url = f"https://graph.microsoft.com/v1.0/me/drive/root:{remote_path}:/content"
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/zip"
+            }
+            with open(zip_path, "rb") as f:
+                resp = session.put(upload_url, headers=headers, data=f, timeout=120)
         if resp.status_code in (200, 201):
             st.info("Backup uploaded to OneDrive via Microsoft Graph.")
             return True
@@ -268,11 +512,12 @@ def ensure_dropbox_folder():
     token = get_dropbox_access_token()
     if not token:
         return False
+    session = _dropbox_client()["session"]
     try:
         url = "https://api.dropboxapi.com/2/files/create_folder_v2"
         headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
         payload = {"path": DROPBOX_BACKUP_FOLDER, "autorename": False}
-        resp = requests.post(url, headers=headers, json=payload, timeout=30)
+        resp = session.post(url, headers=headers, json=payload, timeout=30)
         # 200/201 okay; 409 (path/conflict) means folder exists — that's fine
         if resp.status_code in (200, 201):
             return True
@@ -283,37 +528,95 @@ def ensure_dropbox_folder():
             token2 = get_dropbox_access_token(force_refresh=True)
             if token2 and token2 != token:
                 headers["Authorization"] = f"Bearer {token2}"
-                resp2 = requests.post(url, headers=headers, json=payload, timeout=30)
+                resp2 = session.post(url, headers=headers, json=payload, timeout=30)
                 if resp2.status_code in (200, 201, 409):
                     return True
     except Exception:
         pass
     return True  # best-effort; allow uploads to attempt anyway
 
+DROPBOX_SIMPLE_UPLOAD_LIMIT = 8 * 1024 * 1024
+DROPBOX_CHUNK_SIZE = 8 * 1024 * 1024
+DROPBOX_CHUNK_RETRIES = 3
+
+def _dropbox_upload_large(session, drop_path, zip_path: Path, token):
+    """
+    Upload-session flow for zips over the single-call limit: start a session,
+    append fixed-size chunks, then commit. Only one chunk is held in memory,
+    and an offset mismatch resumes from the offset Dropbox reports.
+    """
+    def call(endpoint, arg, chunk):
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Dropbox-API-Arg": json.dumps(arg),
+            "Content-Type": "application/octet-stream"
+        }
+        return session.post(f"https://content.dropboxapi.com/2/files/upload_session/{endpoint}",
+                            headers=headers, data=chunk, timeout=120)
+
+    resp = call("start", {"close": False}, b"")
+    if resp.status_code != 200:
+        return resp
+    session_id = resp.json()["session_id"]
+    total = zip_path.stat().st_size
+    offset = 0
+    failures = 0
+    with open(zip_path, "rb") as f:
+        while offset < total:
+            f.seek(offset)
+            chunk = f.read(DROPBOX_CHUNK_SIZE)
+            try:
+                resp = call("append_v2", {"cursor": {"session_id": session_id, "offset": offset}, "close": False}, chunk)
+            except requests.RequestException:
+                resp = None
+            if resp is not None and resp.status_code == 200:
+                offset += len(chunk)
+                failures = 0
+                continue
+            failures += 1
+            if failures > DROPBOX_CHUNK_RETRIES:
+                if resp is None:
+                    raise RuntimeError("Dropbox upload session lost its connection")
+                return resp
+            if resp is not None and resp.status_code == 409:
+                # incorrect_offset carries the offset the session actually reached
+                try:
+                    correct = resp.json().get("error", {}).get("correct_offset")
+                except ValueError:
+                    correct = None
+                if correct is not None:
+                    offset = int(correct)
+    commit = {"path": drop_path, "mode": "add", "autorename": True, "mute": False}
+    return call("finish", {"cursor": {"session_id": session_id, "offset": offset}, "commit": commit}, b"")
+
+def _dropbox_upload(session, drop_path, zip_path: Path, token):
+    if zip_path.stat().st_size > DROPBOX_SIMPLE_UPLOAD_LIMIT:
+        return _dropbox_upload_large(session, drop_path, zip_path, token)
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Dropbox-API-Arg": json.dumps({
+            "path": drop_path,
+            "mode": "add",
+            "autorename": True,
+            "mute": False
+        }),
+        "Content-Type": "application/octet-stream"
+    }
+    with open(zip_path, "rb") as f:
+        return session.post("https://content.dropboxapi.com/2/files/upload", headers=headers, data=f, timeout=120)
+
 def upload_zip_to_dropbox(zip_path: Path):
-    """Upload a zip to Dropbox Apps folder using content endpoint."""
+    """Upload a zip to Dropbox Apps folder (upload session for large zips)."""
     token = get_dropbox_access_token()
     if not token:
         st.warning("Dropbox credentials are not configured (missing refresh token/app key/app secret).")
         return False
+    session = _dropbox_client()["session"]
     try:
         ensure_dropbox_folder()
         filename = zip_path.name
         drop_path = f"{DROPBOX_BACKUP_FOLDER}/{filename}"
-        upload_url = "https://content.dropboxapi.com/2/files/upload"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Dropbox-API-Arg": json.dumps({
-                "path": drop_path,
-                "mode": "add",
-                "autorename": True,
-                "mute": False
-            }),
-            "Content-Type": "application/octet-stream"
-        }
-        with open(zip_path, "rb") as f:
-            data = f.read()
-        resp = requests.post(upload_url, headers=headers, data=data, timeout=120)
+        resp = _dropbox_upload(session, drop_path, zip_path, token)
         if resp.status_code in (200, 201):
             st.info(f"Backup uploaded to Dropbox: {drop_path}")
             return True
@@ -322,8 +625,7 @@ def upload_zip_to_dropbox(zip_path: Path):
             if resp.status_code in (401, 400):
                 token2 = get_dropbox_access_token(force_refresh=True)
                 if token2:
-                    headers["Authorization"] = f"Bearer {token2}"
-                    resp2 = requests.post(upload_url, headers=headers, data=data, timeout=120)
+                    resp2 = _dropbox_upload(session, drop_path, zip_path, token2)
                     if resp2.status_code in (200, 201):
                         st.info(f"Backup uploaded to Dropbox after refresh: {drop_path}")
                         return True
@@ -338,18 +640,19 @@ def list_dropbox_backups():
     token = get_dropbox_access_token()
     if not token:
         return []
+    session = _dropbox_client()["session"]
     try:
         url = "https://api.dropboxapi.com/2/files/list_folder"
         headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
         payload = {"path": DROPBOX_BACKUP_FOLDER, "recursive": False, "limit": 100}
-        resp = requests.post(url, headers=headers, json=payload, timeout=30)
+        resp = session.post(url, headers=headers, json=payload, timeout=30)
         if resp.status_code != 200:
             # try forced refresh once
             if resp.status_code in (401, 400):
                 token2 = get_dropbox_access_token(force_refresh=True)
                 if token2:
                     headers["Authorization"] = f"Bearer {token2}"
-                    resp2 = requests.post(url, headers=headers, json=payload, timeout=30)
+                    resp2 = session.post(url, headers=headers, json=payload, timeout=30)
                     if resp2.status_code == 200:
                         data = resp2.json()
                         entries = data.get("entries", [])
@@ -371,9 +674,7 @@ def find_latest_dropbox_backup():
     # Choose latest by server_modified if available, otherwise by name
     def key_fn(e):
         return e.get("server_modified") or e.get("client_modified") or e.get("name")
-    files_sorted = sorted(files, key=key_fn, reverse=True)
-    latest = files_sorted[0]
-    return latest if latest else None
+    return max(files, key=key_fn)
 
 def download_dropbox_file(remote_path: str, dest: Path):
     """Download a dropbox file (remote_path e.g. /Apps/AcucommBackups/data_backup.zip) to local dest Path."""
@@ -381,13 +682,14 @@ def download_dropbox_file(remote_path: str, dest: Path):
     if not token:
         st.warning("Dropbox credentials are not configured (missing refresh token/app key/app secret).")
         return False
+    session = _dropbox_client()["session"]
     try:
         download_url = "https://content.dropboxapi.com/2/files/download"
         headers = {
             "Authorization": f"Bearer {token}",
             "Dropbox-API-Arg": json.dumps({"path": remote_path})
         }
-        resp = requests.post(download_url, headers=headers, timeout=120)
+        resp = session.post(download_url, headers=headers, timeout=120)
         if resp.status_code == 200:
             with open(dest, "wb") as f:
                 f.write(resp.content)
@@ -398,7 +700,7 @@ def download_dropbox_file(remote_path: str, dest: Path):
                 token2 = get_dropbox_access_token(force_refresh=True)
                 if token2:
                     headers["Authorization"] = f"Bearer {token2}"
-                    resp2 = requests.post(download_url, headers=headers, timeout=120)
+                    resp2 = session.post(download_url, headers=headers, timeout=120)
                     if resp2.status_code == 200:
                         with open(dest, "wb") as f:
                             f.write(resp2.content)
@@ -409,71 +711,215 @@ def download_dropbox_file(remote_path: str, dest: Path):
         st.warning(f"Exception downloading from Dropbox: {e}")
         return False
 
-def backup_data():
-    zip_path = create_local_zip()
-    if not zip_path:
-        return False
-    ok_local = copy_zip_to_onedrive(zip_path)
-    ok_graph = upload_zip_to_onedrive_graph(zip_path)
-    ok_dropbox = upload_zip_to_dropbox(zip_path)
-    # Return True if any destination succeeded
-    return ok_local or ok_graph or ok_dropbox
+BACKUP_UPLOADS = (copy_zip_to_onedrive, upload_zip_to_onedrive_graph, upload_zip_to_dropbox)
+
+def upload_backup(zip_path: Path, uploads=BACKUP_UPLOADS, concurrent=True):
+    """
+    Send the zip to the OneDrive folder, Graph and Dropbox (or the given
+    subset of BACKUP_UPLOADS) concurrently; they wait on different
+    devices/hosts, so the slowest sets the wall time.
+    The caller's Streamlit context is passed on so their messages still render.
+    concurrent=False sends one after another (no new threads can be started
+    once the interpreter is shutting down).
+    Returns one result per upload, by default (onedrive_copy_ok, graph_ok, dropbox_ok).
+    """
+    if not concurrent:
+        return tuple(upload(zip_path) for upload in uploads)
+    ctx = get_script_run_ctx()
+
+    def run(upload):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return upload(zip_path)
+
+    with ThreadPoolExecutor(max_workers=len(uploads), thread_name_prefix="upload") as pool:
+        futures = [pool.submit(run, upload) for upload in uploads]
+        return tuple(f.result() for f in futures)
+
+def backup_data(concurrent=True):
+    """
+    Build the backup zip once and hand the same file to every destination.
+    The zip is kept on disk on purpose: it is the first restore source in
+    auto_restore_if_needed and the OneDrive folder copy needs a real file.
+    The Graph upload streams it from the open handle, so nothing is read
+    into memory a second time.
+    """
+    worker = _backup_worker()
+    with worker["zip_lock"]:
+        zip_path = create_local_zip()
+        if not zip_path:
+            return False
+        # The zip is only rewritten when DATA_DIR changed, so an unchanged
+        # (mtime_ns, size) means a destination that took it already has it.
+        # Destinations that failed last time are retried with the same zip.
+        fingerprint = _zip_fingerprint(zip_path)
+        pending = tuple(u for u in BACKUP_UPLOADS if worker["uploaded"].get(u.__name__) != fingerprint)
+        if pending:
+            _remember_uploads(fingerprint, pending, upload_backup(zip_path, pending, concurrent))
+        # Return True if any destination holds this zip
+        return fingerprint in worker["uploaded"].values()
+
+def _zip_fingerprint(zip_path: Path):
+    stat = zip_path.stat()
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _remember_uploads(fingerprint, uploads, results):
+    """Record, per destination, the zip version it last accepted."""
+    uploaded = _backup_worker()["uploaded"]
+    for upload, ok in zip(uploads, results):
+        if ok:
+            uploaded[upload.__name__] = fingerprint
+
+# Automatic backups start at most this often; saves in between are picked up
+# by one trailing run. The manual backup button is not throttled.
+BACKUP_MIN_INTERVAL = 300  # seconds
+
+@st.cache_resource
+def _backup_worker():
+    """Process-wide single backup thread and its bookkeeping (survives reruns)."""
+    worker = {
+        "executor": ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup"),
+        "lock": threading.Lock(),
+        # Re-entrant: held across zip + upload, and create_local_zip takes it too
+        "zip_lock": threading.RLock(),
+        "queued": False,
+        "timer": None,  # throttle timer holding back the queued run, if any
+        "last_started": None,
+        "last_finished": None,
+        "last_ok": None,
+        "uploaded": {},  # upload function name -> (mtime_ns, size) of the last zip it accepted
+    }
+    atexit.register(_flush_pending_backup, worker)
+    return worker
+
+def _flush_pending_backup(worker):
+    """
+    At shutdown, run a backup the throttle timer is still holding back, so
+    saves from the last BACKUP_MIN_INTERVAL aren't lost with the process (an
+    ephemeral host would otherwise restore the older remote zip on restart).
+    The executor is already shut down by now, so this runs inline.
+    """
+    with worker["lock"]:
+        timer = worker["timer"]
+        if timer is None:
+            return
+        timer.cancel()
+        worker["timer"] = None
+        worker["queued"] = False
+    try:
+        backup_data(concurrent=False)
+    except Exception as e:
+        print("Backup at shutdown failed:", e)
+
+def _run_queued_backup():
+    worker = _backup_worker()
+    with worker["lock"]:
+        worker["queued"] = False
+        worker["timer"] = None
+        worker["last_started"] = time.monotonic()
+    try:
+        ok = backup_data()
+    except Exception as e:
+        print("Background backup failed:", e)
+        ok = False
+    worker["last_finished"] = datetime.now()
+    worker["last_ok"] = ok
+
+def schedule_backup():
+    """
+    Queue backup_data on the background thread so saves don't wait on the
+    zip and uploads. Bursts of saves collapse into one queued run: if a run
+    is already waiting it will pick up the latest data anyway. A run is
+    delayed until BACKUP_MIN_INTERVAL has passed since the previous one
+    started, so a busy session doesn't re-zip and re-upload on every click;
+    a run still held back when the process exits is flushed by atexit.
+    Returns False when an already-queued run covers this save.
+    """
+    worker = _backup_worker()
+    with worker["lock"]:
+        if worker["queued"]:
+            return False
+        worker["queued"] = True
+        delay = 0.0
+        if worker["last_started"] is not None:
+            delay = BACKUP_MIN_INTERVAL - (time.monotonic() - worker["last_started"])
+        if delay > 0:
+            # Wait on a timer thread rather than tying up the worker; kept so
+            # _flush_pending_backup can run it early at shutdown
+            timer = threading.Timer(delay, worker["executor"].submit, args=(_run_queued_backup,))
+            timer.daemon = True
+            worker["timer"] = timer
+    if delay > 0:
+        timer.start()
+    else:
+        worker["executor"].submit(_run_queued_backup)
+    return True
 
 def find_latest_onedrive_backup():
     try:
-        if not ONE_DRIVE_BACKUP_DIR.exists():
+        if not _onedrive_ready():
             return None
-        pattern = str(ONE_DRIVE_BACKUP_DIR / "data_backup_*.zip")
-        matches = sorted(glob.glob(pattern), reverse=True)
-        if matches:
-            return Path(matches[0])
-        pattern2 = str(ONE_DRIVE_BACKUP_DIR / "data_backup*.zip")
-        matches2 = sorted(glob.glob(pattern2), reverse=True)
-        if matches2:
-            return Path(matches2[0])
-        zips = sorted(ONE_DRIVE_BACKUP_DIR.glob("*.zip"), key=lambda p: p.stat().st_mtime, reverse=True)
-        if zips:
-            return zips[0]
+        # One scandir pass: timestamped data_backup* names win by name, other
+        # zips by mtime (DirEntry.stat() needs no extra syscall on Windows)
+        named = None
+        newest = None
+        with os.scandir(ONE_DRIVE_BACKUP_DIR) as entries:
+            for e in entries:
+                if not e.name.endswith(".zip"):
+                    continue
+                if e.name.startswith("data_backup"):
+                    if named is None or e.name > named:
+                        named = e.name
+                elif named is None:
+                    m = e.stat().st_mtime
+                    if newest is None or m > newest[0]:
+                        newest = (m, e.name)
+        if named is not None:
+            return ONE_DRIVE_BACKUP_DIR / named
+        if newest is not None:
+            return ONE_DRIVE_BACKUP_DIR / newest[1]
     except Exception:
         pass
     return None
 
 def restore_from_zip(zip_path: Path):
     try:
-        if DATA_DIR.exists():
-            for item in DATA_DIR.iterdir():
-                try:
-                    if item.is_dir():
-                        shutil.rmtree(item)
-                    else:
-                        item.unlink()
-                except Exception:
-                    pass
-        else:
-            DATA_DIR.mkdir(parents=True, exist_ok=True)
+        # One recursive delete of the old data instead of a Python loop per entry
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
         shutil.unpack_archive(str(zip_path), extract_dir=str(DATA_DIR))
+        DUMP_DIR.mkdir(parents=True, exist_ok=True)
         st.success(f"Restored data from backup: {zip_path.name}")
         return True
     except Exception as e:
         st.warning(f"Restore failed from {zip_path}: {e}")
         return False
 
+def _has_saved_rows():
+    """Cheap check for existing data: Parquet footer row count, or a data line after the CSV header."""
+    try:
+        if DATA_FILE.exists() and DATA_FILE.stat().st_size > 0:
+            import pyarrow.parquet as pq
+            return pq.read_metadata(DATA_FILE).num_rows > 0
+        if LEGACY_CSV_FILE.exists() and LEGACY_CSV_FILE.stat().st_size > 0:
+            with open(LEGACY_CSV_FILE, "rb") as f:
+                f.readline()
+                return bool(f.readline().strip())
+    except Exception:
+        pass
+    return False
+
 def auto_restore_if_needed():
     """
     On start, attempt restore in this order:
-      1) If DATA_FILE exists and has data -> do nothing
+      1) If DATA_FILE (or the legacy CSV) exists and has data -> do nothing
       2) If local BACKUP_FILE exists -> restore from it
       3) If OneDrive folder has backups -> restore from latest
       4) If Dropbox has backups -> download latest and restore
       5) Otherwise initialize empty
     """
-    if DATA_FILE.exists():
-        try:
-            df = pd.read_csv(DATA_FILE)
-            if not df.empty:
-                return
-        except Exception:
-            pass
+    if _has_saved_rows():
+        return
     # 2) local zip
     if BACKUP_FILE.exists():
         try:
@@ -509,10 +955,25 @@ def auto_restore_if_needed():
         pass
     st.info("No backup found to restore from (local, OneDrive, or Dropbox). If this is first run, data folder is initialized empty.")
 
-try:
-    auto_restore_if_needed()
-except Exception:
-    pass
+@st.cache_resource(show_spinner=False)
+def _restore_state():
+    """Process-wide flag so the restore check runs once per server, not once per rerun."""
+    return {"done": False, "lock": threading.Lock()}
+
+def _ensure_restored():
+    state = _restore_state()
+    if state["done"]:
+        return
+    with state["lock"]:
+        if state["done"]:
+            return
+        try:
+            auto_restore_if_needed()
+        except Exception:
+            pass
+        state["done"] = True
+
+_ensure_restored()
 
 # ====================================================
 # === EMAIL CONFIG ===
@@ -533,71 +994,169 @@ MANUFACTURER_EMAIL = st.secrets.get("MANUFACTURER_EMAIL")
 # Hold last detailed error for UI feedback (keeps backward compatibility)
 LAST_EMAIL_ERROR = None
 
-def send_email(subject, html_body, to_emails):
+SMTP_SERVER = get_secret("SMTP_SERVER") or "smtp.office365.com"
+
+@st.cache_resource(show_spinner=False)
+def _smtp_pool():
     """
-    Robust email sender with failover:
+    Process-wide authenticated SMTP session, reused across sends and reruns,
+    plus the transport ("ssl" or "starttls") that last logged in.
+    """
+    return {"server": None, "transport": None, "lock": threading.Lock()}
+
+def _smtp_ssl():
+    return smtplib.SMTP_SSL(SMTP_SERVER, 465, timeout=30)
+
+def _smtp_starttls():
+    server = smtplib.SMTP(SMTP_SERVER, 587, timeout=30)
+    try:
+        server.ehlo()
+        server.starttls()
+        server.ehlo()
+    except Exception:
+        server.close()
+        raise
+    return server
+
+SMTP_TRANSPORTS = {"ssl": _smtp_ssl, "starttls": _smtp_starttls}
+
+def _smtp_connect(pool):
+    """
+    Open and log in a new SMTP session with failover:
       - Try implicit SSL (SMTP_SSL) on port 465 first.
       - If that fails, try STARTTLS on port 587.
+    Once a transport has worked only that one is tried, until it fails. A
+    rejected login is raised straight away, since the same credentials would
+    fail on both.
+    Raises with all errors combined if nothing works.
+    """
+    names = [pool["transport"]] if pool["transport"] else list(SMTP_TRANSPORTS)
+    errors = []
+    for name in names:
+        server = None
+        try:
+            server = SMTP_TRANSPORTS[name]()
+            server.login(SENDER_EMAIL, SENDER_PASSWORD)
+            pool["transport"] = name
+            return server
+        except smtplib.SMTPAuthenticationError:
+            server.close()
+            raise
+        except Exception as e:
+            if server is not None:
+                server.close()
+            errors.append(f"{name} failed: {e}")
+    # The remembered transport stopped working; try both again next time
+    pool["transport"] = None
+    raise RuntimeError(" | ".join(errors))
+
+def send_email(subject, html_body, to_emails):
+    """
+    Send through the shared SMTP session, logging in only when there is no
+    live session; a dropped session is reopened once and the send retried.
     Returns True on success, False on failure. On failure, LAST_EMAIL_ERROR will contain details.
     """
     global LAST_EMAIL_ERROR
-    LAST_EMAIL_ERROR = None
+    pool = _smtp_pool()
+    # LAST_EMAIL_ERROR is only set and cleared under the pool lock, so a queued
+    # send can't reset it in the middle of another send
+    with pool["lock"]:
+        LAST_EMAIL_ERROR = None
 
-    if not SENDER_EMAIL or not SENDER_PASSWORD:
-        LAST_EMAIL_ERROR = "Sender credentials not configured (SENDER_EMAIL or SENDER_PASSWORD missing)."
-        return False
+        if not SENDER_EMAIL or not SENDER_PASSWORD:
+            LAST_EMAIL_ERROR = "Sender credentials not configured (SENDER_EMAIL or SENDER_PASSWORD missing)."
+            return False
 
-    recipients = [to_emails] if isinstance(to_emails, str) else list(to_emails)
-    msg = MIMEMultipart()
-    msg["From"] = SENDER_EMAIL
-    msg["To"] = ", ".join(recipients)
-    msg["Subject"] = subject
-    msg.attach(MIMEText(html_body, "html"))
+        recipients = [to_emails] if isinstance(to_emails, str) else list(to_emails)
+        msg = MIMEMultipart()
+        msg["From"] = SENDER_EMAIL
+        msg["To"] = ", ".join(recipients)
+        msg["Subject"] = subject
+        msg.attach(MIMEText(html_body, "html"))
 
-    # 1) Try SMTP_SSL (implicit TLS) on port 465
-    try:
-        with smtplib.SMTP_SSL(SMTP_SERVER, 465, timeout=30) as server:
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.sendmail(SENDER_EMAIL, recipients, msg.as_string())
-        LAST_EMAIL_ERROR = None
-        return True
-    except Exception as e_ssl:
-        # Save the SSL error and attempt STARTTLS fallback
-        LAST_EMAIL_ERROR = f"SSL send failed: {e_ssl}"
-        # fall through to STARTTLS attempt
-
-    # 2) Try STARTTLS on port 587 as fallback
-    try:
-        with smtplib.SMTP(SMTP_SERVER, 587, timeout=30) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.sendmail(SENDER_EMAIL, recipients, msg.as_string())
-        LAST_EMAIL_ERROR = None
-        return True
-    except Exception as e_tls:
-        # Combine errors for easier troubleshooting
-        LAST_EMAIL_ERROR = (LAST_EMAIL_ERROR or "") + f" | STARTTLS failed: {e_tls}"
+        for attempt in range(2):
+            try:
+                if pool["server"] is None:
+                    pool["server"] = _smtp_connect(pool)
+                pool["server"].sendmail(SENDER_EMAIL, recipients, msg.as_string())
+                return True
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                # Idle session closed or reset by the server; reconnect once
+                try:
+                    if pool["server"] is not None:
+                        pool["server"].close()
+                except Exception:
+                    pass
+                pool["server"] = None
+                LAST_EMAIL_ERROR = f"SMTP session dropped: {e}"
+            except Exception as e:
+                try:
+                    if pool["server"] is not None:
+                        pool["server"].close()
+                except Exception:
+                    pass
+                pool["server"] = None
+                LAST_EMAIL_ERROR = str(e)
+                break
         try:
             # Also print to stdout for logs if possible
             print("Email send errors:", LAST_EMAIL_ERROR)
         except Exception:
             pass
-        return False
+    return False
+
+@st.cache_resource(show_spinner=False)
+def _email_executor():
+    """
+    Process-wide thread for queued notifications, separate from the backup
+    worker so an email never waits behind a zip and its uploads. One thread
+    is enough: sends share the one SMTP session anyway.
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="email")
+
+def queue_email(subject, html_body, to_emails):
+    """Send a notification on the background email thread so the UI doesn't wait on SMTP."""
+    _email_executor().submit(send_email, subject, html_body, to_emails)
 
 # ====================================================
 # === LOGO & HEADER ===
 # ====================================================
 logo_path = ROOT / "DBN_Metro.png"
+
+# Every version of every attachment is a new key; keep only recent ones in memory
+FILE_CACHE_ENTRIES = 16
+
+@st.cache_data(show_spinner=False, max_entries=FILE_CACHE_ENTRIES)
+def _read_file_bytes(path_str, mtime):
+    """Contents of an attached document, read once per file version rather than per rerun."""
+    return Path(path_str).read_bytes()
+
+# Logos are immutable bytes/strings, so cache_resource hands back the same
+# object every rerun instead of the copy st.cache_data would make.
+@st.cache_resource(show_spinner=False)
+def _logo_html(path_str, mtime):
+    """Header <img> markup with the logo inlined as a data URI."""
+    encoded = base64.b64encode(Path(path_str).read_bytes()).decode("ascii")
+    return f"<div style='text-align:center;'><img src='data:image/png;base64,{encoded}' width='70'/></div>"
+
+@st.cache_resource(show_spinner=False)
+def _read_image_bytes(path_str, mtime):
+    """Raw bytes of a page logo for st.image, read once per file version."""
+    return Path(path_str).read_bytes()
+
+def centered_image(path: Path, width):
+    """
+    Show a page logo centred with a three-column layout. The old pair of
+    markdown <div> wrappers were separate elements, so they never wrapped the
+    image; this also saves two HTML elements per rerun.
+    """
+    side = max(1, (704 - width) // 2)  # 704px: main column width of layout="centered"
+    _, mid, _ = st.columns([side, width, side])
+    mid.image(_read_image_bytes(str(path), path.stat().st_mtime), width=width)
+
 if logo_path.exists():
     try:
-        with open(logo_path, "rb") as img_file:
-            encoded_logo = base64.b64encode(img_file.read()).decode()
-        st.markdown(
-            f"<div style='text-align:center;'><img src='data:image/png;base64,{encoded_logo}' width='70'/></div>",
-            unsafe_allow_html=True,
-        )
+        st.markdown(_logo_html(str(logo_path), logo_path.stat().st_mtime), unsafe_allow_html=True)
     except Exception:
         st.warning("Logo found but couldn't be displayed.")
 else:
@@ -609,7 +1168,10 @@ st.markdown("---")
 # ====================================================
 # === AUTHENTICATION ===
 # ====================================================
-def hash_password(p): return hashlib.sha256(p.encode()).hexdigest()
+PBKDF2_ITERATIONS = 200_000
+LOGIN_CACHE_SIZE = 512
+
+def hash_password(p, salt): return hashlib.pbkdf2_hmac("sha256", p.encode(), salt, PBKDF2_ITERATIONS).hex()
 
 raw_users = {
     "Deezlo": {"name": "Deezlo", "password": "Deezlo123", "role": "contractor", "email": CONTRACTOR_EMAIL},
@@ -623,7 +1185,47 @@ raw_users = {
     # Add admin user mapping here if you want an 'admin' role user, else the admin check uses the email check below
 }
 
-CREDENTIALS = {u: {"name": v["name"], "password_hash": hash_password(v["password"]), "role": v["role"], "email": v["email"]} for u, v in raw_users.items()}
+@st.cache_resource
+def _get_credentials():
+    """Salt and hash the user table once per process instead of on every rerun."""
+    creds = {}
+    for u, v in raw_users.items():
+        salt = os.urandom(16)
+        creds[u] = {"name": v["name"], "salt": salt, "password_hash": hash_password(v["password"], salt), "role": v["role"], "email": v["email"]}
+    return creds
+
+CREDENTIALS = _get_credentials()
+
+@st.cache_resource
+def _login_cache():
+    """
+    Recent login results (hits and misses), so retries and reruns skip the
+    PBKDF2 cost. Keyed by an HMAC under a per-process random key, so no
+    crackable password hash sits in the cache.
+    """
+    return {"key": os.urandom(32), "results": {}, "lock": threading.Lock()}
+
+def verify_password(username, password):
+    cache = _login_cache()
+    tag = (username, hmac.new(cache["key"], password.encode(), hashlib.sha256).hexdigest())
+    with cache["lock"]:
+        cached = cache["results"].get(tag)
+    if cached is not None:
+        return cached
+    user = CREDENTIALS.get(username)
+    if user is None:
+        # Same PBKDF2 cost as a real user so response time doesn't reveal valid usernames
+        hash_password(password, b"\0" * 16)
+        ok = False
+    else:
+        ok = hmac.compare_digest(hash_password(password, user["salt"]), user["password_hash"])
+    with cache["lock"]:
+        results = cache["results"]
+        results[tag] = ok
+        if len(results) > LOGIN_CACHE_SIZE:
+            # dicts keep insertion order: drop the oldest entry
+            del results[next(iter(results))]
+    return ok
 
 if "auth" not in st.session_state:
     st.session_state.auth = {"logged_in": False, "username": None, "role": None, "name": None}
@@ -638,45 +1240,269 @@ def safe_rerun():
 # === DATA HANDLING (with redundancy) ===
 # Add manufacturer-specific fields to the same data file
 # ====================================================
+# Per-save dumps are opt-in (set KEEP_CSV_DUMPS=1 in secrets or env; the
+# name predates the switch to Parquet dumps). The backup zip already versions
+# the data file. When enabled, only the newest DUMP_RETENTION dumps are kept
+# so DUMP_DIR and the zip stay small.
+KEEP_CSV_DUMPS = str(get_secret("KEEP_CSV_DUMPS") or "").strip().lower() in ("1", "true", "yes")
+DUMP_RETENTION = 20
+
+# Low-cardinality columns are held as categoricals so the per-rerun equality
+# filters compare small integer codes. The known workflow values are always
+# categories (so status updates can assign them); other values found in the
+# data are added on load.
+STATUS_PENDING = "Pending Verification"
+STATUS_PENDING_CITY = "Pending City Approval (Manufacturer Delivery)"
+STATUS_APPROVED = "Approved / Issued"
+STATUS_DECLINED = "Declined"
+STATUS_RECEIVED = "Received"
+STATUS_VALUES = [STATUS_PENDING, STATUS_PENDING_CITY, STATUS_APPROVED, STATUS_DECLINED, STATUS_RECEIVED]
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+METER_TYPES = ["DN25 Meter", "DN15 Meter", "CIU Keypad"]
+# A handful of contractor and manufacturer companies repeat across every row;
+# no fixed list, all from the data
+CATEGORY_COLUMNS = {"Status": STATUS_VALUES, "Meter_Type": METER_TYPES, "Contractor_Name": [], "Manufacturer_Name": []}
+
+# Quantities are nullable integers: 4 bytes a cell and numeric comparisons
+# instead of parsing strings. Blank cells are <NA>.
+QTY_COLUMNS = ["Requested_Qty", "Approved_Qty", "Dispatch_Qty"]
+QTY_MIN, QTY_MAX = int(np.iinfo(np.int32).min), int(np.iinfo(np.int32).max)
+RECORD_COLUMNS = [
+    "Date_Requested", "Request_ID", "Contractor_Name", "Installer_Name",
+    "Meter_Type", "Requested_Qty", "Approved_Qty", "Photo_Path",
+    "Status", "Contractor_Notes", "City_Notes", "Decline_Reason",
+    "Date_Approved", "Date_Received",
+    # Manufacturer dispatch fields (kept in the same data file)
+    "Manufacturer_Name", "Batch_Number", "Dispatch_Qty", "Dispatch_Date", "Dispatch_Note", "Dispatch_Docs"
+]
+# Starting point for new rows: submit paths only spell out the fields they set
+BLANK_RECORD = {col: (pd.NA if col in QTY_COLUMNS else "") for col in RECORD_COLUMNS}
+
+def to_qty(value, default=pd.NA):
+    """
+    Parse a quantity cell or text input; blank or non-numeric gives `default`.
+    Raises ValueError for a number the Int32 quantity columns can't hold.
+    """
+    try:
+        qty = int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return default
+    if not QTY_MIN <= qty <= QTY_MAX:
+        raise ValueError(f"quantity {qty} is out of range (at most {QTY_MAX})")
+    return qty
+
+def _with_qty_ints(df):
+    for col in QTY_COLUMNS:
+        # Already Int32 when read back from Parquet: nothing to parse or range-check
+        if col in df.columns and df[col].dtype != "Int32":
+            qty = pd.to_numeric(df[col], errors="coerce").round()
+            # A value outside Int32 (e.g. a typo in old data) would make the cast
+            # raise and take the whole load down with it; blank just that cell
+            df[col] = qty.where(qty.between(QTY_MIN, QTY_MAX)).astype("Int32")
+    return df
+
+def update_record(df, request_id, values):
+    """Write several fields of one record with a single label lookup and one row write."""
+    df.loc[request_id, list(values)] = list(values.values())
+
+def _with_categories(df):
+    for col, known in CATEGORY_COLUMNS.items():
+        if col in df.columns:
+            # Read back from Parquet the column is already categorical: its
+            # categories are the values, no need to scan the rows
+            values = df[col].cat.categories if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].dropna().unique()
+            extra = sorted(v for v in values.tolist() if v not in known)
+            df[col] = pd.Categorical(df[col], categories=known + extra)
+    return df
+
+def ensure_category(df, col, value):
+    """Add a free-text value (e.g. a manager edit) to a categorical column before assigning it."""
+    # Data saved before a column existed won't have it yet; the assignment adds it
+    if col not in df.columns or pd.isna(value):
+        return
+    if isinstance(df[col].dtype, pd.CategoricalDtype) and value not in df[col].cat.categories:
+        df[col] = df[col].cat.add_categories([value])
+
+def append_records(df, entries):
+    """
+    Append new request rows in one concat. The new rows are cast to the
+    frame's dtypes first, so the result keeps its categoricals, Int32 qty
+    columns and Request_ID index instead of falling back to object.
+    Columns the stored data predates are added by the concat.
+    """
+    new = pd.DataFrame(entries)
+    for col in CATEGORY_COLUMNS:
+        if col in new.columns:
+            for value in new[col].dropna().unique():
+                ensure_category(df, col, value)
+    shared = {col: dtype for col, dtype in df.dtypes.items() if col in new.columns}
+    new = new.astype(shared).set_index("Request_ID", drop=False)
+    return pd.concat([df, new])
+
+# Derived per-version caches only need the current version plus one or two a
+# concurrent session may still hold; older entries are O(N) and can go.
+VERSION_CACHE_ENTRIES = 4
+
+@st.cache_data(show_spinner=False, max_entries=VERSION_CACHE_ENTRIES)
+def _load_data_cached(version):
+    """
+    Parse DATA_FILE once per on-disk version. `version` is only the cache key;
+    st.cache_data hands every caller its own copy, so callers may mutate it.
+    The version of the bytes actually read (fstat of the open file, which
+    os.replace in save_data can't swap underneath) goes in df.attrs, since
+    another session may save between data_version() and the read.
+    """
+    try:
+        f = open(DATA_FILE, "rb")
+    except FileNotFoundError:
+        return _empty_frame()
+    # Read errors propagate (and aren't cached): load_data reports them
+    with f:
+        loaded = _stat_version(os.fstat(f.fileno()))
+        df = pd.read_parquet(f)
+    # Stores from before the dispatch fields (e.g. a migrated legacy CSV)
+    # lack some RECORD_COLUMNS; add them blank so every consumer sees the full schema
+    df = df.reindex(columns=RECORD_COLUMNS + [c for c in df.columns if c not in RECORD_COLUMNS])
+    # Parquet keeps the Int32 and categorical columns typed; only free text
+    # (and anything a legacy all-string store left untyped) becomes
+    # Arrow-backed strings: cheaper masks and str.contains than object columns
+    typed = set(QTY_COLUMNS) | set(CATEGORY_COLUMNS)
+    df = df.astype({col: STRING_DTYPE for col in df.columns if col not in typed})
+    df = _with_qty_ints(_with_categories(df))
+    # Index by Request_ID (column kept) so row updates are hash lookups
+    df = df.set_index("Request_ID", drop=False)
+    df.attrs["data_version"] = loaded
+    return df
+
+def _empty_frame():
+    df = _with_qty_ints(_with_categories(pd.DataFrame(columns=RECORD_COLUMNS, dtype=STRING_DTYPE)))
+    df = df.set_index("Request_ID", drop=False)
+    df.attrs["data_version"] = (0, 0)
+    return df
+
+def migrate_legacy_csv():
+    """Convert the pre-Parquet CSV store (or a CSV restored from an old backup) once."""
+    if DATA_FILE.exists() or not LEGACY_CSV_FILE.exists():
+        return
+    try:
+        df = read_csv_fast(LEGACY_CSV_FILE)
+        # Atomic, so a failed write leaves no partial DATA_FILE to block a retry
+        write_parquet_atomic(df, DATA_FILE)
+        # The CSV is now a stale copy; set it aside so backups stop carrying it
+        os.replace(LEGACY_CSV_FILE, MIGRATED_CSV_FILE)
+    except Exception as e:
+        st.warning(f"Could not migrate {LEGACY_CSV_FILE.name} to Parquet: {e}")
+
+migrate_legacy_csv()
+
+def data_version():
+    """
+    Cache key for loading DATA_FILE: (mtime_ns, size) from a single stat,
+    (0, 0) if absent. Nanoseconds plus size still tell apart two saves that
+    land inside a coarse filesystem timestamp tick. Caches derived from a
+    loaded frame key on frame_version() instead.
+    """
+    try:
+        return _stat_version(DATA_FILE.stat())
+    except FileNotFoundError:
+        return (0, 0)
+
+def _stat_version(stat):
+    return (stat.st_mtime_ns, stat.st_size)
+
+# Set by load_data when DATA_FILE exists but can't be read; save_data refuses
+# to run then, since writing the (empty) frame would replace every stored record
+DATA_LOAD_ERROR = None
+
 def load_data():
-    if DATA_FILE.exists():
-        try:
-            df = pd.read_csv(DATA_FILE, dtype=str)
-            return df
-        except Exception:
-            pass
-    cols = [
-        "Date_Requested", "Request_ID", "Contractor_Name", "Installer_Name",
-        "Meter_Type", "Requested_Qty", "Approved_Qty", "Photo_Path",
-        "Status", "Contractor_Notes", "City_Notes", "Decline_Reason",
-        "Date_Approved", "Date_Received",
-        # Manufacturer dispatch fields (kept in same CSV)
-        "Manufacturer_Name", "Batch_Number", "Dispatch_Qty", "Dispatch_Date", "Dispatch_Note", "Dispatch_Docs"
-    ]
-    return pd.DataFrame(columns=cols)
+    global DATA_LOAD_ERROR
+    try:
+        df = _load_data_cached(data_version())
+    except Exception as e:
+        DATA_LOAD_ERROR = str(e)
+        st.error(f"Could not load {DATA_FILE.name}; saving is disabled until it loads again. Reason: {e}")
+        return _empty_frame()
+    DATA_LOAD_ERROR = None
+    return df
+
+def frame_version(df):
+    """
+    Version a loaded frame was read from. Caches derived from a frame must key
+    on this, not on a fresh data_version(): the file may have moved on since.
+    """
+    return df.attrs["data_version"]
+
+def get_record(df, request_id):
+    """Row for a Request_ID by index label (first one if an ID repeats)."""
+    row = df.loc[request_id]
+    if isinstance(row, pd.DataFrame):
+        row = row.iloc[0]
+    return row
 
 def save_data(df):
+    if DATA_LOAD_ERROR is not None:
+        st.error("Not saved: the stored data could not be loaded, and saving now would overwrite it.")
+        st.stop()
     try:
-        df.to_csv(DATA_FILE, index=False)
+        # New rows arrive as plain Python values; store quantities as Int32 either way
+        write_parquet_atomic(_with_qty_ints(df.reset_index(drop=True)), DATA_FILE)
     except Exception as e:
         st.warning(f"Could not save main data file: {e}")
+    _load_data_cached.clear()
+    if KEEP_CSV_DUMPS:
+        try:
+            # The dump is the Parquet snapshot just written, so copy it rather than re-encode
+            dump_filename = f"stock_requests_{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.parquet"
+            shutil.copyfile(DATA_FILE, DUMP_DIR / dump_filename)
+            # Timestamped names sort chronologically
+            for old in sorted(DUMP_DIR.glob("stock_requests_*.parquet"))[:-DUMP_RETENTION]:
+                old.unlink()
+        except Exception as e:
+            st.warning(f"Could not create dump: {e}")
     try:
-        dump_filename = f"stock_requests_{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.csv"
-        df.to_csv(DUMP_DIR / dump_filename, index=False)
-    except Exception as e:
-        st.warning(f"Could not create dump: {e}")
-    try:
-        ok = backup_data()
-        if ok:
-            st.success("Backup succeeded (OneDrive or Dropbox upload).")
-        else:
-            st.info("Backup created locally; OneDrive/Dropbox upload not configured or failed.")
+        schedule_backup()
+        # A toast survives the safe_rerun() that follows most saves; st.info is the pre-1.27 fallback
+        notify = getattr(st, "toast", st.info)
+        notify("Backup queued; OneDrive/Dropbox upload runs in the background.")
     except Exception as e:
         st.warning(f"Automatic backup failed: {e}")
 
 def generate_request_id(prefix="REQ"):
     return f"{prefix}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def save_uploaded_file(uploaded, dest: Path):
+    """Write a st.file_uploader upload to dest in fixed 1 MiB chunks."""
+    uploaded.seek(0)
+    with open(dest, "wb") as f:
+        shutil.copyfileobj(uploaded, f, UPLOAD_CHUNK_SIZE)
+
+DISPLAY_ROW_LIMIT = 500
+# Server file paths mean nothing in the browser; the record views show photos and documents
+HIDDEN_TABLE_COLUMNS = ["Photo_Path", "Dispatch_Docs"]
+
+def show_records(frame, key):
+    """
+    Render one page of at most DISPLAY_ROW_LIMIT rows so each rerun ships a
+    bounded table to the browser. `key` keeps each table's page selector apart.
+    """
+    pages = max(1, -(-len(frame) // DISPLAY_ROW_LIMIT))
+    page = 1
+    if pages > 1:
+        # Seeded through session_state only: also passing value= makes Streamlit
+        # warn about a widget with a default that was set via the Session State API
+        if st.session_state.get(f"page_{key}", pages + 1) > pages:
+            # First render, or the table shrank (new filter, deleted rows); start at the first page
+            st.session_state[f"page_{key}"] = 1
+        page = st.number_input("Page", min_value=1, max_value=pages, step=1, key=f"page_{key}")
+    start = (page - 1) * DISPLAY_ROW_LIMIT
+    shown = frame.iloc[start:start + DISPLAY_ROW_LIMIT].drop(columns=HIDDEN_TABLE_COLUMNS, errors="ignore")
+    if pages > 1:
+        st.caption(f"Showing rows {start + 1}-{start + len(shown)} of {len(frame)}")
+    # Display copy as text so blanks show as "" (Int32 / categorical columns can't hold "")
+    st.dataframe(shown.astype(STRING_DTYPE).fillna(""), use_container_width=True, hide_index=True)
+
 # ====================================================
 # === LOGIN UI ===
 # ====================================================
@@ -685,7 +1511,7 @@ def login_ui():
     username = st.text_input("Username")
     password = st.text_input("Password", type="password")
     if st.button("Login"):
-        if username in CREDENTIALS and hash_password(password) == CREDENTIALS[username]["password_hash"]:
+        if verify_password(username, password):
             st.session_state.auth.update({
                 "logged_in": True,
                 "username": username,
@@ -713,9 +1539,7 @@ def contractor_ui():
     contractor_logo = ROOT / "contractor logo.jpg"
 
     if contractor_logo.exists():
-        st.markdown("<div style='display:flex;justify-content:center;'>", unsafe_allow_html=True)
-        st.image(str(contractor_logo), width=500)
-        st.markdown("</div>", unsafe_allow_html=True)
+        centered_image(contractor_logo, 500)
 
     st.markdown("---")
 
@@ -730,6 +1554,7 @@ def contractor_ui():
     dn25_qty = col1.number_input(
         "DN25 Meter Quantity",
         min_value=0,
+        max_value=QTY_MAX,
         value=0,
         step=1
     )
@@ -737,6 +1562,7 @@ def contractor_ui():
     dn15_qty = col2.number_input(
         "DN15 Meter Quantity",
         min_value=0,
+        max_value=QTY_MAX,
         value=0,
         step=1
     )
@@ -744,6 +1570,7 @@ def contractor_ui():
     keypad_qty = col3.number_input(
         "CIU Keypad Quantity",
         min_value=0,
+        max_value=QTY_MAX,
         value=0,
         step=1
     )
@@ -764,44 +1591,32 @@ def contractor_ui():
 
             base_rid = generate_request_id(prefix="REQ")
 
-            entries = []
-
-            for item_type, qty in [
-                ("DN25 Meter", dn25_qty),
-                ("DN15 Meter", dn15_qty),
-                ("CIU Keypad", keypad_qty)
-            ]:
-
-                if qty > 0:
-
-                    rid = f"{base_rid}-{item_type.replace(' ', '_')[:10]}"
-
-                    entries.append({
-                        "Date_Requested": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "Request_ID": rid,
-                        "Contractor_Name": contractor_name,
-                        "Installer_Name": installer_name,
-                        "Meter_Type": item_type,
-                        "Requested_Qty": str(qty),
-                        "Approved_Qty": "",
-                        "Photo_Path": "",
-                        "Status": "Pending Verification",
-                        "Contractor_Notes": notes,
-                        "City_Notes": "",
-                        "Decline_Reason": "",
-                        "Date_Approved": "",
-                        "Date_Received": "",
-                        "Manufacturer_Name": "",
-                        "Batch_Number": "",
-                        "Dispatch_Qty": "",
-                        "Dispatch_Date": "",
-                        "Dispatch_Note": "",
-                        "Dispatch_Docs": ""
-                    })
+            # One timestamp for every row of this submission
+            ts = datetime.now().strftime(TS_FORMAT)
+
+            entries = [
+                {
+                    **BLANK_RECORD,
+                    "Date_Requested": ts,
+                    "Request_ID": f"{base_rid}-{item_type.replace(' ', '_')[:10]}",
+                    "Contractor_Name": contractor_name,
+                    "Installer_Name": installer_name,
+                    "Meter_Type": item_type,
+                    "Requested_Qty": int(qty),
+                    "Status": STATUS_PENDING,
+                    "Contractor_Notes": notes,
+                }
+                for item_type, qty in [
+                    ("DN25 Meter", dn25_qty),
+                    ("DN15 Meter", dn15_qty),
+                    ("CIU Keypad", keypad_qty)
+                ]
+                if qty > 0
+            ]
 
             if entries:
 
-                df = pd.concat([df, pd.DataFrame(entries)], ignore_index=True)
+                df = append_records(df, entries)
 
                 save_data(df)
 
@@ -838,6 +1653,7 @@ def manufacturer_ui():
     dn25_dispatch_qty = col1.number_input(
         "DN25 Meter Dispatch Quantity",
         min_value=0,
+        max_value=QTY_MAX,
         value=0,
         step=1
     )
@@ -845,6 +1661,7 @@ def manufacturer_ui():
     dn15_dispatch_qty = col2.number_input(
         "DN15 Meter Dispatch Quantity",
         min_value=0,
+        max_value=QTY_MAX,
         value=0,
         step=1
     )
@@ -852,6 +1669,7 @@ def manufacturer_ui():
     manu_keypad_qty = col3.number_input(
         "CIU Keypad Dispatch Quantity",
         min_value=0,
+        max_value=QTY_MAX,
         value=0,
         step=1
     )
@@ -888,8 +1706,6 @@ def manufacturer_ui():
 
             base_rid = generate_request_id(prefix="MANU")
 
-            entries = []
-
             doc_path = ""
 
             if dispatch_docs:
@@ -900,8 +1716,7 @@ def manufacturer_ui():
 
                 try:
 
-                    with open(dest, "wb") as f:
-                        f.write(dispatch_docs.getbuffer())
+                    save_uploaded_file(dispatch_docs, dest)
 
                     doc_path = str(dest)
 
@@ -909,44 +1724,34 @@ def manufacturer_ui():
 
                     st.warning(f"Could not save attached document: {e}")
 
-            for item_type, qty in [
-                ("DN25 Meter", dn25_dispatch_qty),
-                ("DN15 Meter", dn15_dispatch_qty),
-                ("CIU Keypad", manu_keypad_qty)
-            ]:
-
-                if qty > 0:
-
-                    rid = f"{base_rid}-{item_type.replace(' ', '_')[:10]}"
-
-                    new = {
-                        "Date_Requested": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "Request_ID": rid,
-                        "Contractor_Name": "",
-                        "Installer_Name": "",
-                        "Meter_Type": item_type,
-                        "Requested_Qty": "",
-                        "Approved_Qty": "",
-                        "Photo_Path": "",
-                        "Status": "Pending City Approval (Manufacturer Delivery)",
-                        "Contractor_Notes": "",
-                        "City_Notes": "",
-                        "Decline_Reason": "",
-                        "Date_Approved": "",
-                        "Date_Received": "",
-                        "Manufacturer_Name": manu_name,
-                        "Batch_Number": batch_num,
-                        "Dispatch_Qty": str(qty),
-                        "Dispatch_Date": dispatch_date.strftime("%Y-%m-%d"),
-                        "Dispatch_Note": dispatch_note,
-                        "Dispatch_Docs": doc_path
-                    }
-
-                    entries.append(new)
+            ts = datetime.now().strftime(TS_FORMAT)
+            dispatch_day = dispatch_date.strftime("%Y-%m-%d")
+
+            entries = [
+                {
+                    **BLANK_RECORD,
+                    "Date_Requested": ts,
+                    "Request_ID": f"{base_rid}-{item_type.replace(' ', '_')[:10]}",
+                    "Meter_Type": item_type,
+                    "Status": STATUS_PENDING_CITY,
+                    "Manufacturer_Name": manu_name,
+                    "Batch_Number": batch_num,
+                    "Dispatch_Qty": int(qty),
+                    "Dispatch_Date": dispatch_day,
+                    "Dispatch_Note": dispatch_note,
+                    "Dispatch_Docs": doc_path
+                }
+                for item_type, qty in [
+                    ("DN25 Meter", dn25_dispatch_qty),
+                    ("DN15 Meter", dn15_dispatch_qty),
+                    ("CIU Keypad", manu_keypad_qty)
+                ]
+                if qty > 0
+            ]
 
             if entries:
 
-                df = pd.concat([df, pd.DataFrame(entries)], ignore_index=True)
+                df = append_records(df, entries)
 
                 save_data(df)
 
@@ -959,7 +1764,7 @@ def manufacturer_ui():
 
                     if ETHEKWINI_EMAIL:
 
-                        send_email(
+                        queue_email(
                             subject=f"Manufacturer Dispatch Pending Approval: {base_rid}",
                             html_body=(
                                 f"<p>Manufacturer <b>{manu_name}</b> "
@@ -975,24 +1780,43 @@ def manufacturer_ui():
 # === CITY UI (UPDATED REPORT DETAILS) ===
 # ====================================================
 def _safe(val):
-    return "" if val is None or (isinstance(val, float) and pd.isna(val)) else str(val)
+    return "" if val is None or (pd.api.types.is_scalar(val) and pd.isna(val)) else str(val)
 
 
 def _display_file_link(path_str, label="Download"):
     try:
         p = Path(path_str)
         if p.exists():
-            with open(p, "rb") as f:
-                data = f.read()
-            b64 = base64.b64encode(data).decode()
-            href = f"data:application/octet-stream;base64,{b64}"
-            st.markdown(f"[{label}]({href})")
+            # Served by Streamlit's media endpoint on click, not inlined into the page as base64
+            st.download_button(label, data=_read_file_bytes(str(p), p.stat().st_mtime), file_name=p.name, key=f"dl_{p}")
             return True
     except Exception:
         pass
     return False
 
 
+@st.cache_data(show_spinner=False, max_entries=VERSION_CACHE_ENTRIES)
+def _meter_type_options(version, _df):
+    return sorted(_df["Meter_Type"].dropna().unique().tolist())
+
+@st.cache_data(show_spinner=False, max_entries=VERSION_CACHE_ENTRIES)
+def _installer_keys(version, _df):
+    """Lower-cased Installer_Name as a categorical, built once per data version."""
+    return _df["Installer_Name"].str.lower().astype("category")
+
+@st.cache_data(show_spinner=False, max_entries=VERSION_CACHE_ENTRIES)
+def _status_positions(version, _df):
+    """Row positions per Status, grouped once per data version."""
+    return {status: pos for status, pos in _df.groupby("Status", observed=True).indices.items()}
+
+def status_mask(df, statuses):
+    """Boolean row mask for the given statuses from the precomputed groups (no column scan)."""
+    groups = _status_positions(frame_version(df), df)
+    mask = np.zeros(len(df), dtype=bool)
+    for status in statuses:
+        mask[groups.get(status, [])] = True
+    return mask
+
 def city_ui():
     st.header("eThekwini Municipality - Verify Requests & Manufacturer Deliveries")
     df = load_data()
@@ -1004,29 +1828,31 @@ def city_ui():
     st.markdown("### Filters")
     col1, col2, col3 = st.columns([1,1,1])
     with col1:
-        view_choice = st.selectbox("Show records", ["All", "Pending Verification", "Pending City Approval (Manufacturer Delivery)", "Approved / Issued", "Declined", "Received"])
+        view_choice = st.selectbox("Show records", ["All"] + STATUS_VALUES)
     with col2:
         filter_manu = st.text_input("Filter by Manufacturer Name (partial)")
     with col3:
-        filter_type = st.selectbox("Product Type (or All)", options=["All"] + sorted(df["Meter_Type"].dropna().unique().tolist()))
+        filter_type = st.selectbox("Product Type (or All)", options=["All"] + _meter_type_options(frame_version(df), df))
 
-    view_df = df.copy()
+    # One combined mask and a single slice instead of a copy plus three re-slices
+    mask = np.ones(len(df), dtype=bool)
     if view_choice != "All":
-        view_df = view_df[view_df["Status"] == view_choice]
+        mask &= status_mask(df, [view_choice])
     if filter_manu:
-        view_df = view_df[view_df["Manufacturer_Name"].fillna("").str.contains(filter_manu, case=False, na=False)]
+        mask &= df["Manufacturer_Name"].str.contains(filter_manu, case=False, na=False, regex=False).to_numpy(dtype=bool)
     if filter_type and filter_type != "All":
-        view_df = view_df[view_df["Meter_Type"] == filter_type]
+        mask &= (df["Meter_Type"] == filter_type).to_numpy()
+    view_df = df[mask]
 
     st.markdown("### Matching Records")
-    st.dataframe(view_df.fillna(""), use_container_width=True)
+    show_records(view_df, "city")
 
     st.markdown("---")
     st.markdown("### Take Action")
     # Provide selection of record to act on
     sel_id = st.selectbox("Select Request/Dispatch ID to act on", [""] + view_df["Request_ID"].tolist())
     if sel_id:
-        record = df[df["Request_ID"] == sel_id].iloc[0].to_dict()
+        record = get_record(df, sel_id)
 
         # --- Improved Report Details Section ---
         st.markdown("**Record details:**")
@@ -1087,25 +1913,27 @@ def city_ui():
         # If this is a manufacturer dispatch
         if record.get("Status", "").startswith("Pending City Approval"):
             st.subheader("Manufacturer Dispatch Actions")
-            approved_qty = st.number_input("Approved Quantity to accept into stock", min_value=0, value=int(record.get("Dispatch_Qty") or 0))
+            approved_qty = st.number_input("Approved Quantity to accept into stock", min_value=0, max_value=QTY_MAX, value=to_qty(record.get("Dispatch_Qty"), 0))
             city_notes = st.text_area("City Notes")
             photo = st.file_uploader("Upload proof photo (optional)", type=["jpg", "png"] )
             decline_reason = st.text_input("Decline reason (if declining)")
             approve_btn, decline_btn = st.columns(2)
             if approve_btn.button("Approve Manufacturer Dispatch"):
                 # update row
-                df.loc[df["Request_ID"] == sel_id, "Approved_Qty"] = str(approved_qty)
+                updates = {
+                    "Approved_Qty": int(approved_qty),
+                    "Status": STATUS_APPROVED,
+                    "City_Notes": city_notes,
+                    "Date_Approved": datetime.now().strftime(TS_FORMAT),
+                }
                 if photo:
                     dest = PHOTO_DIR / f"{sel_id}_{photo.name}"
                     try:
-                        with open(dest, "wb") as f:
-                            f.write(photo.getbuffer())
-                        df.loc[df["Request_ID"] == sel_id, "Photo_Path"] = str(dest)
+                        save_uploaded_file(photo, dest)
+                        updates["Photo_Path"] = str(dest)
                     except Exception:
                         st.warning("Could not save photo.")
-                df.loc[df["Request_ID"] == sel_id, "Status"] = "Approved / Issued"
-                df.loc[df["Request_ID"] == sel_id, "City_Notes"] = city_notes
-                df.loc[df["Request_ID"] == sel_id, "Date_Approved"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                update_record(df, sel_id, updates)
                 save_data(df)
                 st.success("✅ Manufacturer dispatch approved and issued to stock.")
                 # optional: notify manufacturer and manager via email
@@ -1116,7 +1944,7 @@ def city_ui():
                     if MANAGER_EMAIL:
                         recipients.append(MANAGER_EMAIL)
                     if recipients:
-                        send_email(
+                        queue_email(
                             subject=f"Dispatch Approved: {sel_id}",
                             html_body=f"<p>Your dispatch <b>{sel_id}</b> has been approved by City. Approved Qty: {approved_qty}</p>",
                             to_emails=recipients
@@ -1126,14 +1954,12 @@ def city_ui():
                 safe_rerun()
             if decline_btn.button("Decline Manufacturer Dispatch"):
                 reason = decline_reason or "No reason provided"
-                df.loc[df["Request_ID"] == sel_id, "Status"] = "Declined"
-                df.loc[df["Request_ID"] == sel_id, "Decline_Reason"] = reason
-                df.loc[df["Request_ID"] == sel_id, "City_Notes"] = city_notes
+                update_record(df, sel_id, {"Status": STATUS_DECLINED, "Decline_Reason": reason, "City_Notes": city_notes})
                 save_data(df)
                 st.error("❌ Manufacturer dispatch declined.")
                 try:
                     if MANUFACTURER_EMAIL:
-                        send_email(
+                        queue_email(
                             subject=f"Dispatch Declined: {sel_id}",
                             html_body=f"<p>Your dispatch <b>{sel_id}</b> was declined by City. Reason: {reason}</p>",
                             to_emails=MANUFACTURER_EMAIL
@@ -1142,37 +1968,37 @@ def city_ui():
                     pass
                 safe_rerun()
         # If this is a contractor request pending verification
-        elif record.get("Status", "") == "Pending Verification":
+        elif record.get("Status", "") == STATUS_PENDING:
             st.subheader("Contractor Request Verification")
             try:
-                default_qty = int(record.get("Requested_Qty") or 0)
+                default_qty = to_qty(record.get("Requested_Qty"), 0)
             except Exception:
                 default_qty = 0
-            qty = st.number_input("Approved Qty", min_value=0, value=default_qty)
+            qty = st.number_input("Approved Qty", min_value=0, max_value=QTY_MAX, value=default_qty)
             photo = st.file_uploader("Upload proof photo", type=["jpg", "png"]) 
             notes = st.text_area("Notes")
             decline_reason = st.text_input("Decline reason")
             if st.button("Approve Contractor Request"):
-                df.loc[df["Request_ID"] == sel_id, "Approved_Qty"] = str(qty)
                 ppath = ""
                 if photo:
                     dest = PHOTO_DIR / f"{sel_id}_{photo.name}"
                     try:
-                        with open(dest, "wb") as f:
-                            f.write(photo.getbuffer())
+                        save_uploaded_file(photo, dest)
                         ppath = str(dest)
                     except Exception:
                         st.warning("Could not save photo.")
-                df.loc[df["Request_ID"] == sel_id, "Photo_Path"] = ppath
-                df.loc[df["Request_ID"] == sel_id, "Status"] = "Approved / Issued"
-                df.loc[df["Request_ID"] == sel_id, "City_Notes"] = notes
-                df.loc[df["Request_ID"] == sel_id, "Date_Approved"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                update_record(df, sel_id, {
+                    "Approved_Qty": int(qty),
+                    "Photo_Path": ppath,
+                    "Status": STATUS_APPROVED,
+                    "City_Notes": notes,
+                    "Date_Approved": datetime.now().strftime(TS_FORMAT),
+                })
                 save_data(df)
                 st.success("✅ Approved and issued.")
                 safe_rerun()
             if st.button("Decline Contractor Request"):
-                df.loc[df["Request_ID"] == sel_id, "Status"] = "Declined"
-                df.loc[df["Request_ID"] == sel_id, "Decline_Reason"] = decline_reason
+                update_record(df, sel_id, {"Status": STATUS_DECLINED, "Decline_Reason": decline_reason})
                 save_data(df)
                 st.error("❌ Declined.")
                 safe_rerun()
@@ -1186,36 +2012,80 @@ def installer_ui():
     st.header("Meter Installer - Mark Received Stock")
     acucomm_logo = ROOT / "acucomm logo.jpg"
     if acucomm_logo.exists():
-        st.markdown("<div style='display:flex;justify-content:center;'>", unsafe_allow_html=True)
-        st.image(str(acucomm_logo), width=250)
-        st.markdown("</div>", unsafe_allow_html=True)
+        centered_image(acucomm_logo, 250)
     st.markdown("---")
     df = load_data()
     installer = st.session_state.auth["name"].strip().lower()
-    if "Installer_Name" in df.columns and df["Installer_Name"].notna().any():
-        try:
-            approved = df[df["Installer_Name"].str.lower() == installer]
-        except Exception:
-            approved = df.copy()
-    else:
-        approved = df.copy()
     try:
-        approved = approved[approved["Status"].str.contains("Approved", na=False)]
-    except Exception:
-        pass
-    st.dataframe(approved.fillna(""), use_container_width=True)
+        mine = (_installer_keys(frame_version(df), df) == installer).to_numpy(dtype=bool)
+        # Status is categorical: match "Approved" against the few categories, then use their row groups
+        approved_statuses = [c for c in df["Status"].cat.categories if "Approved" in c]
+        # `&` builds a new array; to_numpy() may hand back a read-only view
+        mask = mine & status_mask(df, approved_statuses)
+    except Exception as e:
+        # Never fall back to an unfiltered table: it would show other installers' stock
+        st.error(f"Could not load your approved requests: {e}")
+        mask = np.zeros(len(df), dtype=bool)
+    approved = df[mask]
+    show_records(approved, "installer")
     sel = st.selectbox("Mark as received (Request ID)", [""] + approved["Request_ID"].tolist())
     if sel and st.button("✅ Mark as Received"):
-        df.loc[df["Request_ID"] == sel, "Status"] = "Received"
-        df.loc[df["Request_ID"] == sel, "Date_Received"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        update_record(df, sel, {"Status": STATUS_RECEIVED, "Date_Received": datetime.now().strftime(TS_FORMAT)})
         save_data(df)
         st.success(f"Request {sel} marked as received.")
         safe_rerun()
 
+@st.cache_data(show_spinner=False, max_entries=VERSION_CACHE_ENTRIES)
+def _reconciliation_totals(version, _df):
+    """
+    Requested / approved / dispatched totals per meter type and installer, one
+    groupby per data version. dropna=False keeps manufacturer dispatch rows,
+    which have no installer.
+    """
+    return (
+        _df.groupby(["Meter_Type", "Installer_Name"], observed=True, sort=True, dropna=False)[QTY_COLUMNS]
+        .sum()
+        .reset_index()
+    )
+
+# Parsed dumps and their CSV payloads are whole tables; hold only a few
+DUMP_CACHE_ENTRIES = 4
+
+@st.cache_data(show_spinner=False, max_entries=DUMP_CACHE_ENTRIES)
+def _list_dumps(dir_mtime):
+    """
+    Dump file names, newest first. Adding or removing a dump bumps the
+    directory mtime, so the folder is only scanned when its contents change.
+    Parquet dumps, plus any CSV dumps written before the switch.
+    """
+    return sorted((p.name for p in DUMP_DIR.iterdir() if p.suffix in (".parquet", ".csv")), reverse=True)
+
+@st.cache_data(show_spinner=False, max_entries=DUMP_CACHE_ENTRIES)
+def _read_dump(path_str, mtime):
+    """Parse a dump once per file version (Parquet, or a CSV dump from before the switch)."""
+    path = Path(path_str)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return read_csv_fast(path)
+
+@st.cache_data(show_spinner=False, max_entries=DUMP_CACHE_ENTRIES)
+def _dump_csv_bytes(path_str, mtime):
+    """Download payload for a dump: CSV dumps are served as-is, Parquet converted once."""
+    path = Path(path_str)
+    if path.suffix == ".csv":
+        return path.read_bytes()
+    # Encode straight into a byte buffer rather than building the str and then a bytes copy
+    buf = io.BytesIO()
+    pd.read_parquet(path).to_csv(buf, index=False)
+    return buf.getvalue()
+
 def manager_ui():
     st.header("Project Manager - Reconciliation & Export")
     df = load_data()
-    st.dataframe(df.fillna(""), use_container_width=True)
+    show_records(df, "manager")
+    if not df.empty:
+        with st.expander("Reconciliation totals by meter type and installer"):
+            st.dataframe(_reconciliation_totals(frame_version(df), df), use_container_width=True, hide_index=True)
 
     # === Email Test UI (Admin / Manager only) ===
     # Show this panel only to manager/admin roles OR the admin email owner
@@ -1228,7 +2098,7 @@ def manager_ui():
         st.markdown("### ✉️ Email Testing (Admin/Manager only)")
         with st.expander("Send Test Email"):
             test_to = st.text_input("Recipient email (type any address)")
-            test_subject = st.text_input("Subject", value=f"Test Email from Smart Meter Stock Management ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})")
+            test_subject = st.text_input("Subject", value=f"Test Email from Smart Meter Stock Management ({datetime.now().strftime(TS_FORMAT)})")
             test_body = st.text_area("HTML Body", value="<p>This is a test email sent from the Smart Meter Stock Management application. If you received this, email sending is configured correctly.</p>")
             if st.button("Send Test Email"):
                 if not test_to:
@@ -1248,7 +2118,7 @@ def manager_ui():
         with rec_col:
             selected_id = st.selectbox("Select Request ID to edit or delete", [""] + df["Request_ID"].fillna("").tolist())
         if selected_id:
-            record = df[df["Request_ID"] == selected_id].iloc[0].to_dict()
+            record = get_record(df, selected_id)
             st.markdown("#### Selected Record — editable fields")
             # Editable fields - choose a subset that makes sense for manager edits
             with st.form(key=f"edit_form_{selected_id}"):
@@ -1264,7 +2134,7 @@ def manager_ui():
                 approved_qty = a1.text_input("Approved Qty", value=_safe(record.get("Approved_Qty")))
                 status_options = sorted(df["Status"].dropna().unique().tolist())
                 if not status_options:
-                    status_options = ["Pending Verification", "Approved / Issued", "Declined", "Received", "Pending City Approval (Manufacturer Delivery)"]
+                    status_options = list(STATUS_VALUES)
                 status = a2.selectbox("Status", options=status_options, index=status_options.index(_safe(record.get("Status"))) if _safe(record.get("Status")) in status_options else 0)
 
                 mn1, mn2 = st.columns(2)
@@ -1289,30 +2159,43 @@ def manager_ui():
                 if submit_edit:
                     # Defensive updates: ensure df reloaded to avoid concurrency issues
                     df = load_data()
-                    idx = df.index[df["Request_ID"] == selected_id].tolist()
-                    if not idx:
+                    qty_error = None
+                    try:
+                        quantities = {
+                            "Requested_Qty": to_qty(requested_qty),
+                            "Approved_Qty": to_qty(approved_qty),
+                            "Dispatch_Qty": to_qty(dispatch_qty),
+                        }
+                    except ValueError as e:
+                        qty_error = e
+                    if qty_error is not None:
+                        # Validate before writing: the Int32 columns would raise mid-update
+                        st.error(f"Record not saved: {qty_error}")
+                    elif selected_id not in df.index:
                         st.error("Record not found on disk — it may have been removed. Reloading.")
                         safe_rerun()
                     else:
-                        i = idx[0]
-                        df.at[i, "Contractor_Name"] = contractor_name
-                        df.at[i, "Installer_Name"] = installer_name
-                        df.at[i, "Meter_Type"] = meter_type
-                        df.at[i, "Requested_Qty"] = requested_qty
-                        df.at[i, "Approved_Qty"] = approved_qty
-                        df.at[i, "Status"] = status
-                        df.at[i, "Contractor_Notes"] = contractor_notes
-                        df.at[i, "City_Notes"] = city_notes
-                        df.at[i, "Manufacturer_Name"] = manufacturer_name
-                        df.at[i, "Batch_Number"] = batch_number
-                        df.at[i, "Dispatch_Qty"] = dispatch_qty
-                        df.at[i, "Dispatch_Date"] = dispatch_date
+                        values = {
+                            "Contractor_Name": contractor_name,
+                            "Installer_Name": installer_name,
+                            "Meter_Type": meter_type,
+                            "Requested_Qty": quantities["Requested_Qty"],
+                            "Approved_Qty": quantities["Approved_Qty"],
+                            "Status": status,
+                            "Contractor_Notes": contractor_notes,
+                            "City_Notes": city_notes,
+                            "Manufacturer_Name": manufacturer_name,
+                            "Batch_Number": batch_number,
+                            "Dispatch_Qty": quantities["Dispatch_Qty"],
+                            "Dispatch_Date": dispatch_date,
+                        }
                         # if approving now, set Date_Approved if not set
-                        try:
-                            if status == "Approved / Issued" and not _safe(df.at[i, "Date_Approved"]):
-                                df.at[i, "Date_Approved"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        except Exception:
-                            pass
+                        if status == STATUS_APPROVED and not _safe(get_record(df, selected_id).get("Date_Approved")):
+                            values["Date_Approved"] = datetime.now().strftime(TS_FORMAT)
+                        # Free-text edits may introduce new company or meter names
+                        for col in CATEGORY_COLUMNS:
+                            ensure_category(df, col, values[col])
+                        update_record(df, selected_id, values)
                         save_data(df)
                         st.success("Record updated successfully.")
                         safe_rerun()
@@ -1327,7 +2210,7 @@ def manager_ui():
                     st.error("Please confirm deletion by ticking the checkbox before pressing Delete.")
                 else:
                     df = load_data()
-                    if selected_id not in df["Request_ID"].tolist():
+                    if selected_id not in df.index:
                         st.error("Record not found — it may have already been deleted.")
                         safe_rerun()
                     else:
@@ -1337,23 +2220,33 @@ def manager_ui():
                         safe_rerun()
 
     st.markdown("### 📦 Data Dump & Backup")
-    dumps = sorted(DUMP_DIR.glob("*.csv"), reverse=True)
-    if dumps:
-        dump_names = [d.name for d in dumps]
+    dump_names = _list_dumps(DUMP_DIR.stat().st_mtime) if DUMP_DIR.exists() else []
+    if dump_names:
         selected_dump = st.selectbox("Select Dump File", dump_names)
         if selected_dump:
-            dump_df = pd.read_csv(DUMP_DIR / selected_dump)
-            st.dataframe(dump_df.fillna(""), use_container_width=True)
-            st.download_button("Download Selected Dump", dump_df.to_csv(index=False).encode(), selected_dump, "text/csv")
+            dump_path = DUMP_DIR / selected_dump
+            dump_mtime = dump_path.stat().st_mtime
+            show_records(_read_dump(str(dump_path), dump_mtime), "dump")
+            st.download_button("Download Selected Dump", _dump_csv_bytes(str(dump_path), dump_mtime), f"{dump_path.stem}.csv", "text/csv")
     else:
         st.info("No dump files available yet.")
     st.markdown("### 🔁 Manual Backup")
+    worker = _backup_worker()
+    if worker["last_finished"]:
+        outcome = "succeeded" if worker["last_ok"] else "created locally only (uploads failed or not configured)"
+        st.caption(f"Last automatic backup {outcome} at {worker['last_finished'].strftime(TS_FORMAT)}.")
+    if worker["queued"]:
+        st.caption(f"Recent changes are queued for the next automatic backup (at most one every {BACKUP_MIN_INTERVAL // 60} minutes).")
     if st.button("Create & Upload Backup Now"):
-        zipfile = create_local_zip()
-        if zipfile:
-            one_local = copy_zip_to_onedrive(zipfile)
-            graph_uploaded = upload_zip_to_onedrive_graph(zipfile)
-            dropbox_uploaded = upload_zip_to_dropbox(zipfile)
+        # Keep the background run from touching the zip while it is uploading
+        with worker["zip_lock"]:
+            zip_path = create_local_zip()
+            results = None
+            if zip_path:
+                results = upload_backup(zip_path)
+                _remember_uploads(_zip_fingerprint(zip_path), BACKUP_UPLOADS, results)
+        if results:
+            one_local, graph_uploaded, dropbox_uploaded = results
             if one_local or graph_uploaded or dropbox_uploaded:
                 st.success("Backup created and uploaded to at least one configured destination (OneDrive/Dropbox).")
             else:
@@ -1445,23 +2338,4 @@ else:
 # ====================================================
 # === FOOTER ===
 # ====================================================
-st.markdown(f"""
-    <style>
-        .footer {{
-            position: fixed;
-            left: 0;
-            bottom: 0;
-            width: 100%;
-            background-color: #003366;
-            color: white;
-            text-align: center;
-            padding: 10px 0;
-            font-size: 14px;
-            border-top: 1px solid #ddd;
-            z-index: 100;
-        }}
-    </style>
-    <div class="footer">
-        © {datetime.now().year} eThekwini Municipality-WS7761 | Smart Meter Stock Management System
-    </div>
-""", unsafe_allow_html=True)
+emit_html(FOOTER_HTML)